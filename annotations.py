@@ -12,11 +12,50 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
+import os
+import mmap
+import orjson
+import simdjson
 from collections import defaultdict
 from typing import Tuple, List, Dict, Any
 
 
+# the largest document simdjson can parse, 4 GiB
+SIMDJSON_MAX_SIZE = simdjson.MAXSIZE_BYTES
+
+
+def parse_json_file(path):
+    """
+    Parses a JSON file with simdjson through a read-only memory map, so the file is read straight out of the page cache
+    instead of being copied into a python bytes object first.
+
+    Files larger than simdjson can parse are parsed with orjson instead, which materializes the whole document.
+
+    :param path: the path to the JSON file.
+    :return: the lazy simdjson proxy for the document's root, or the document's root as python objects.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+            if os.fstat(fd).st_size > SIMDJSON_MAX_SIZE:
+                with memoryview(mm) as buffer:
+                    return orjson.loads(buffer)
+            return simdjson.Parser().parse(mm)
+    finally:
+        os.close(fd)
+
+
+def as_python(value):
+    """
+    Converts a simdjson proxy returned by `parse_json_file` to python objects. Values parsed by orjson already are.
+    """
+    if isinstance(value, simdjson.Object):
+        return value.as_dict()
+    if isinstance(value, simdjson.Array):
+        return value.as_list()
+    return value
+
+
 def isaid_annotations(path) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
     """
     iSAID stores annotations in a flat array, not grouped by image, so this function reorganizes them.
@@ -36,9 +75,9 @@ def isaid_annotations(path) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[s
     :param path: the path to the JSON annotations file.
     :return: list of categories, dictionary of filename keys and list of annotations values
     """
-    with open(path) as fp:
-        obj = json.load(fp)
+    obj = parse_json_file(path)
 
+    # only the id and file_name of each image are materialized as python objects
     filename_by_image_id = {}
     for i in obj['images']:
         filename_by_image_id[i['id']] = i['file_name']
@@ -46,9 +85,9 @@ def isaid_annotations(path) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[s
     annotations_by_filename = defaultdict(list)
     for a in obj['annotations']:
         filename = filename_by_image_id[a['image_id']]
-        annotations_by_filename[filename].append(a)
+        annotations_by_filename[filename].append(as_python(a))
 
-    return obj['categories'], dict(annotations_by_filename)
+    return as_python(obj['categories']), dict(annotations_by_filename)
 
 
 def mapillary_annotations(path) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
@@ -67,11 +106,11 @@ def mapillary_annotations(path) -> Tuple[List[Dict[str, Any]], Dict[str, List[Di
     :param path: the path to the JSON annotations file.
     :return: list of categories, dictionary of filename keys and list of annotations values
     """
-    with open(path) as fp:
-        obj = json.load(fp)
+    obj = parse_json_file(path)
 
+    # the rest of each image's entry is never materialized as python objects
     annotations_by_filename = {}
     for a in obj['annotations']:
-        annotations_by_filename[a['file_name']] = a['segments_info']
+        annotations_by_filename[a['file_name']] = as_python(a['segments_info'])
 
-    return obj['categories'], annotations_by_filename
+    return as_python(obj['categories']), annotations_by_filename
@@ -14,12 +14,16 @@
 
 import os
 import argparse
+import functools
 import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
 from tqdm import tqdm
 from annotations import mapillary_annotations, isaid_annotations
-from collections import defaultdict
 import numpy as np
-from typing import List, Dict, Any
+import numba
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import List, Dict, Any, Tuple, Iterable
 
 """
 Columns:
@@ -80,6 +84,79 @@ Columns:
 """
 
 
+# the columns before the per-category columns
+FIXED_COLUMNS = (
+    'ImageID',
+    'NumInstances',
+    'NumCategories',
+    'TotalArea',
+    'MinArea',
+    'MeanArea',
+    'MaxArea',
+    'StdevArea',
+    'MeanX',
+    'MeanY',
+    'StdevX',
+    'StdevY',
+    'Highest_NumInstances',
+    'Highest_TotalArea',
+    'Highest_MinArea',
+    'Highest_MeanArea',
+    'Highest_MaxArea',
+    'Highest_StdevArea',
+    'Lowest_NumInstances',
+    'Lowest_TotalArea',
+    'Lowest_MinArea',
+    'Lowest_MeanArea',
+    'Lowest_MaxArea',
+    'Lowest_StdevArea',
+    'CategoryOf_Highest_NumInstances',
+    'CategoryOf_Highest_TotalArea',
+    'CategoryOf_Highest_MinArea',
+    'CategoryOf_Highest_MeanArea',
+    'CategoryOf_Highest_MaxArea',
+    'CategoryOf_Highest_StdevArea',
+    'CategoryOf_Lowest_NumInstances',
+    'CategoryOf_Lowest_TotalArea',
+    'CategoryOf_Lowest_MinArea',
+    'CategoryOf_Lowest_MeanArea',
+    'CategoryOf_Lowest_MaxArea',
+    'CategoryOf_Lowest_StdevArea',
+)
+
+# the columns for each category, named <field>_<category id>
+CATEGORY_FIELDS = (
+    'NumInstances',
+    'TotalArea',
+    'MinArea',
+    'MeanArea',
+    'MaxArea',
+    'StdevArea',
+    'MeanX',
+    'MeanY',
+    'StdevX',
+    'StdevY',
+)
+
+NUM_FIXED_COLUMNS = len(FIXED_COLUMNS)
+NUM_CATEGORY_COLUMNS = len(CATEGORY_FIELDS)
+
+
+def create_header_columns(category_ids) -> List[str]:
+    """
+    Creates the column names for the index.
+
+    :param category_ids: All of the category IDs.
+    :return: list of column names
+    """
+    return [*FIXED_COLUMNS, *(f'{field}_{category_id}' for category_id in category_ids for field in CATEGORY_FIELDS)]
+
+
+# the columns that hold counts or category ids
+INTEGER_COLUMN_PREFIXES = ('NumInstances', 'NumCategories', 'Highest_NumInstances', 'Lowest_NumInstances',
+                           'CategoryOf_')
+
+
 def create_header_row(category_ids, sep=',') -> str:
     """
     Creates the header row for the index.
@@ -88,62 +165,173 @@ def create_header_row(category_ids, sep=',') -> str:
     :param sep: Optional separator for each column. Default is ','.
     :return: header row string
     """
-    columns = [
-        'ImageID',
-        'NumInstances',
-        'NumCategories',
-        'TotalArea',
-        'MinArea',
-        'MeanArea',
-        'MaxArea',
-        'StdevArea',
-        'MeanX',
-        'MeanY',
-        'StdevX',
-        'StdevY',
-        'Highest_NumInstances',
-        'Highest_TotalArea',
-        'Highest_MinArea',
-        'Highest_MeanArea',
-        'Highest_MaxArea',
-        'Highest_StdevArea',
-        'Lowest_NumInstances',
-        'Lowest_TotalArea',
-        'Lowest_MinArea',
-        'Lowest_MeanArea',
-        'Lowest_MaxArea',
-        'Lowest_StdevArea',
-        'CategoryOf_Highest_NumInstances',
-        'CategoryOf_Highest_TotalArea',
-        'CategoryOf_Highest_MinArea',
-        'CategoryOf_Highest_MeanArea',
-        'CategoryOf_Highest_MaxArea',
-        'CategoryOf_Highest_StdevArea',
-        'CategoryOf_Lowest_NumInstances',
-        'CategoryOf_Lowest_TotalArea',
-        'CategoryOf_Lowest_MinArea',
-        'CategoryOf_Lowest_MeanArea',
-        'CategoryOf_Lowest_MaxArea',
-        'CategoryOf_Lowest_StdevArea',
-    ]
-    for category_id in category_ids:
-        columns.extend([
-            f'NumInstances_{category_id}',
-            f'TotalArea_{category_id}',
-            f'MinArea_{category_id}',
-            f'MeanArea_{category_id}',
-            f'MaxArea_{category_id}',
-            f'StdevArea_{category_id}',
-            f'MeanX_{category_id}',
-            f'MeanY_{category_id}',
-            f'StdevX_{category_id}',
-            f'StdevY_{category_id}',
-        ])
+    return sep.join(create_header_columns(category_ids))
+
+
+# columns of the per-category stats, in the same order as CATEGORY_FIELDS
+NUM_INSTANCES, TOTAL_AREA, MIN_AREA, MEAN_AREA, MAX_AREA, STDEV_AREA, MEAN_X, MEAN_Y, STDEV_X, STDEV_Y = range(10)
+
+
+@numba.njit('void(int64[:], float64[:], float64[:], float64[:], int32[:], float64[:, :])', cache=True, fastmath=True)
+def compute_stats(cids, areas, xs, ys, cid_to_row, stats):
+    """
+    Computes the per-category stats of an image in a single pass over its instances. Means and stdevs are kept as
+    running (Welford) moments, so no per-category arrays of instances are ever built.
+
+    :param cids: The category id of each instance.
+    :param areas: The area of each instance.
+    :param xs: The x coordinate of each instance.
+    :param ys: The y coordinate of each instance.
+    :param cid_to_row: Maps a category id to its row in `stats`, or -1 for categories that aren't indexed.
+    :param stats: Output array of shape [num categories + 1, NUM_CATEGORY_COLUMNS], with the columns of
+                  CATEGORY_FIELDS. Each indexed category's instances go into its row, and every instance goes into the
+                  last row. Categories without instances are left as 0.
+    """
+    stats[:] = 0
+    total_row = stats.shape[0] - 1
+
+    for i in range(len(cids)):
+        cid = cids[i]
+        row = cid_to_row[cid] if 0 <= cid < len(cid_to_row) else -1
+        area = areas[i]
+        x = xs[i]
+        y = ys[i]
+
+        for r in (row, total_row):
+            if r < 0:
+                continue
+
+            # until the final pass below, the STDEV_ columns hold the running sums of squared differences
+            stats[r, NUM_INSTANCES] += 1
+            n = stats[r, NUM_INSTANCES]
+            stats[r, TOTAL_AREA] += area
+            if n == 1:
+                stats[r, MIN_AREA] = area
+                stats[r, MAX_AREA] = area
+            else:
+                stats[r, MIN_AREA] = min(stats[r, MIN_AREA], area)
+                stats[r, MAX_AREA] = max(stats[r, MAX_AREA], area)
+
+            delta = area - stats[r, MEAN_AREA]
+            stats[r, MEAN_AREA] += delta / n
+            stats[r, STDEV_AREA] += delta * (area - stats[r, MEAN_AREA])
+
+            delta = x - stats[r, MEAN_X]
+            stats[r, MEAN_X] += delta / n
+            stats[r, STDEV_X] += delta * (x - stats[r, MEAN_X])
+
+            delta = y - stats[r, MEAN_Y]
+            stats[r, MEAN_Y] += delta / n
+            stats[r, STDEV_Y] += delta * (y - stats[r, MEAN_Y])
+
+    for r in range(stats.shape[0]):
+        n = stats[r, NUM_INSTANCES]
+        if n > 0:
+            stats[r, STDEV_AREA] = np.sqrt(stats[r, STDEV_AREA] / n)
+            stats[r, STDEV_X] = np.sqrt(stats[r, STDEV_X] / n)
+            stats[r, STDEV_Y] = np.sqrt(stats[r, STDEV_Y] / n)
+
+
+# scratch buffers reused by every create_index_row call in this process, grown by `_scratch_buffers` when needed
+_scratch_cids = np.empty(64, dtype=np.int64)
+_scratch_areas = np.empty(64, dtype=np.float64)
+_scratch_bboxes = np.empty((64, 4), dtype=np.float64)
+
+
+def _scratch_buffers(n):
+    """
+    Gets views of the first `n` entries of the scratch buffers, growing them first if they are too small.
+
+    :param n: The number of annotations the views need to hold.
+    :return: category id, area, and [x, y, w, h] bbox views.
+    """
+    global _scratch_cids, _scratch_areas, _scratch_bboxes
+
+    if n > len(_scratch_areas):
+        size = max(n, 2 * len(_scratch_areas))
+        _scratch_cids = np.empty(size, dtype=np.int64)
+        _scratch_areas = np.empty(size, dtype=np.float64)
+        _scratch_bboxes = np.empty((size, 4), dtype=np.float64)
+
+    return _scratch_cids[:n], _scratch_areas[:n], _scratch_bboxes[:n]
+
+
+def create_category_lookup(category_ids) -> np.ndarray:
+    """
+    Creates a dense lookup table from category id to the category's position in `category_ids`.
+
+    :param category_ids: All of the category IDs.
+    :return: int32 array where entry `cid` is the position of `cid` in `category_ids`, or -1 if it isn't in there.
+    """
+    category_ids = np.asarray(category_ids)
+    cid_to_row = np.full(category_ids.max() + 1, -1, dtype=np.int32)
+    cid_to_row[category_ids] = np.arange(len(category_ids), dtype=np.int32)
+    return cid_to_row
+
+
+def create_index_values(category_ids, filename, annotations, cid_to_row=None) -> List[Any]:
+    """
+    Creates the values of an index row for a single image.
+
+    :param category_ids: All of the category IDs.
+    :param filename: The image's filename with the extension.
+    :param annotations: The list of annotations for this image.
+    :param cid_to_row: Optional lookup table from `create_category_lookup`. Built from `category_ids` if not given.
+    :return: list of this image's values, in the same order as `create_header_columns`.
+    """
+    # lay the annotations out as parallel arrays in a single pass
+    cids, areas, bboxes = _scratch_buffers(len(annotations))
+    for i, a in enumerate(annotations):
+        cids[i] = a['category_id']
+        areas[i] = a['area']
+        bboxes[i] = a['bbox']
+
+    return create_index_values_from_arrays(category_ids, filename, cids, areas, bboxes[:, 0], bboxes[:, 1],
+                                           cid_to_row=cid_to_row)
 
-    return sep.join(columns)
 
+def create_index_values_from_arrays(category_ids, filename, cids, areas, xs, ys, cid_to_row=None) -> List[Any]:
+    """
+    Creates the values of an index row for a single image whose annotations are already laid out as parallel arrays.
 
-def create_index_row(category_ids, filename, annotations, sep=',') -> str:
+    :param category_ids: All of the category IDs.
+    :param filename: The image's filename with the extension.
+    :param cids: int64 array of the category id of each instance.
+    :param areas: float64 array of the area of each instance.
+    :param xs: float64 array of the x coordinate of each instance's bbox.
+    :param ys: float64 array of the y coordinate of each instance's bbox.
+    :param cid_to_row: Optional lookup table from `create_category_lookup`. Built from `category_ids` if not given.
+    :return: list of this image's values, in the same order as `create_header_columns`.
+    """
+    # stats[:-1] are the per-category stats lined up with `category_ids`, stats[-1] covers every instance
+    category_ids = np.asarray(category_ids)
+    if cid_to_row is None:
+        cid_to_row = create_category_lookup(category_ids)
+    stats = np.empty((len(category_ids) + 1, NUM_CATEGORY_COLUMNS), dtype=np.float64)
+    compute_stats(cids, areas, xs, ys, cid_to_row, stats)
+
+    # the Highest_/Lowest_ columns only consider categories that have instances
+    nonempty = stats[:-1, NUM_INSTANCES] > 0
+    nonempty_category_ids = category_ids[nonempty]
+    nonempty_stats = stats[:-1][nonempty, :6]
+    highest = nonempty_stats.argmax(axis=0)
+    lowest = nonempty_stats.argmin(axis=0)
+
+    # every column after ImageID, see `create_header_columns`
+    values = np.empty(NUM_FIXED_COLUMNS - 1 + NUM_CATEGORY_COLUMNS * len(category_ids), dtype=np.float64)
+    values[0] = stats[-1, 0]  # NumInstances
+    values[1] = len(nonempty_category_ids)  # NumCategories
+    values[2:11] = stats[-1, 1:]  # TotalArea ... StdevY
+    values[11:17] = nonempty_stats[highest, np.arange(6)]  # Highest_NumInstances ... Highest_StdevArea
+    values[17:23] = nonempty_stats[lowest, np.arange(6)]  # Lowest_NumInstances ... Lowest_StdevArea
+    values[23:29] = nonempty_category_ids[highest]  # CategoryOf_Highest_NumInstances ... CategoryOf_Highest_StdevArea
+    values[29:35] = nonempty_category_ids[lowest]  # CategoryOf_Lowest_NumInstances ... CategoryOf_Lowest_StdevArea
+    values[35:] = stats[:-1].ravel()  # NumInstances_<category id> ... StdevY_<category id>
+
+    return [os.path.splitext(filename)[0]] + values.tolist()
+
+
+def create_index_row(category_ids, filename, annotations, sep=',', cid_to_row=None) -> str:
     """
     Creates an index row for a single image.
 
@@ -151,98 +339,113 @@ def create_index_row(category_ids, filename, annotations, sep=',') -> str:
     :param filename: The image's filename with the extension.
     :param annotations: The list of annotations for this image.
     :param sep: Optional separator for each column. Default is ','.
+    :param cid_to_row: Optional lookup table from `create_category_lookup`. Built from `category_ids` if not given.
     :return: string for this image's index row.
     """
-    areas = np.array([a['area'] for a in annotations])
-    bboxes = np.array([a['bbox'] for a in annotations])
-
-    # group annotations by category_id
-    annotations_by_cid = defaultdict(list)
-    for a in annotations:
-        annotations_by_cid[a['category_id']].append(a)
-
-    # get the areas grouped by category_id
-    areas_by_cid = {cid: np.array([a['area'] for a in annotations_by_cid[cid]]) for cid in category_ids}
-    bboxes_by_cid = {cid: np.array([a['bbox'] for a in annotations_by_cid[cid]]) for cid in category_ids}
-
-    nonempty_category_ids = [cid for cid in category_ids if len(annotations_by_cid[cid]) > 0]
-
-    # start building the index entry
-    row = [
-        os.path.splitext(filename)[0],  # ImageID
-
-        len(annotations),  # NumInstances
-        len(nonempty_category_ids),  # NumCategories
-
-        # Areas
-        areas.sum(),  # TotalArea
-        areas.min(),  # MinArea
-        areas.mean(),  # MeanArea
-        areas.max(),  # MaxArea
-        areas.std(),  # StdevArea
-
-        # Coords
-        bboxes[:, 0].mean(),  # MeanX
-        bboxes[:, 1].mean(),  # MeanY
-        bboxes[:, 0].std(),  # StdevX
-        bboxes[:, 1].std(),  # StdevY
-
-        # Highest
-        max(len(annotations_by_cid[cid]) for cid in nonempty_category_ids),  # Highest_NumInstances
-        max(areas_by_cid[cid].sum() for cid in nonempty_category_ids),  # Highest_TotalArea
-        max(areas_by_cid[cid].min() for cid in nonempty_category_ids),  # Highest_MinArea
-        max(areas_by_cid[cid].mean() for cid in nonempty_category_ids),  # Highest_MeanArea
-        max(areas_by_cid[cid].max() for cid in nonempty_category_ids),  # Highest_MaxArea
-        max(areas_by_cid[cid].std() for cid in nonempty_category_ids),  # Highest_StdevArea
-
-        # Lowest
-        min(len(annotations_by_cid[cid]) for cid in nonempty_category_ids),  # Lowest_NumInstances
-        min(areas_by_cid[cid].sum() for cid in nonempty_category_ids),  # Lowest_TotalArea
-        min(areas_by_cid[cid].min() for cid in nonempty_category_ids),  # Lowest_MinArea
-        min(areas_by_cid[cid].mean() for cid in nonempty_category_ids),  # Lowest_MeanArea
-        min(areas_by_cid[cid].max() for cid in nonempty_category_ids),  # Lowest_MaxArea
-        min(areas_by_cid[cid].std() for cid in nonempty_category_ids),  # Lowest_StdevArea
-
-        # CategoryOf_Highest
-        max(nonempty_category_ids, key=lambda cid: len(annotations_by_cid[cid])),  # CategoryOf_Highest_NumInstances
-        max(nonempty_category_ids, key=lambda cid: areas_by_cid[cid].sum()),  # CategoryOf_Highest_TotalArea
-        max(nonempty_category_ids, key=lambda cid: areas_by_cid[cid].min()),  # CategoryOf_Highest_MinArea
-        max(nonempty_category_ids, key=lambda cid: areas_by_cid[cid].mean()),  # CategoryOf_Highest_MeanArea
-        max(nonempty_category_ids, key=lambda cid: areas_by_cid[cid].max()),  # CategoryOf_Highest_MaxArea
-        max(nonempty_category_ids, key=lambda cid: areas_by_cid[cid].std()),  # CategoryOf_Highest_StdevArea
-
-        # CategoryOf_Lowest
-        min(nonempty_category_ids, key=lambda cid: len(annotations_by_cid[cid])),  # CategoryOf_Lowest_NumInstances
-        min(nonempty_category_ids, key=lambda cid: areas_by_cid[cid].sum()),  # CategoryOf_Lowest_TotalArea
-        min(nonempty_category_ids, key=lambda cid: areas_by_cid[cid].min()),  # CategoryOf_Lowest_MinArea
-        min(nonempty_category_ids, key=lambda cid: areas_by_cid[cid].mean()),  # CategoryOf_Lowest_MeanArea
-        min(nonempty_category_ids, key=lambda cid: areas_by_cid[cid].max()),  # CategoryOf_Lowest_MaxArea
-        min(nonempty_category_ids, key=lambda cid: areas_by_cid[cid].std()),  # CategoryOf_Lowest_StdevArea
-    ]
+    return format_index_row(create_index_values(category_ids, filename, annotations, cid_to_row=cid_to_row), sep=sep)
+
+
+@functools.lru_cache(maxsize=None)
+def row_template(num_categories: int, sep=',') -> str:
+    """
+    Creates a `str.format` template for a row of the CSV index. Integer columns are formatted without a decimal point.
 
-    for cid in category_ids:
-        category_annotations = annotations_by_cid[cid]
-        category_areas = areas_by_cid[cid]
-        category_bboxes = bboxes_by_cid[cid]
+    :param num_categories: The number of categories in the index.
+    :param sep: Optional separator for each column. Default is ','.
+    :return: template string with one replacement field per column.
+    """
+    fields = ['{:.0f}' if column.startswith(INTEGER_COLUMN_PREFIXES) else '{}'
+              for column in create_header_columns(range(num_categories))]
+    return sep.replace('{', '{{').replace('}', '}}').join(fields)
 
-        row.append(len(category_annotations))  # NumInstances_<category id>
-        row.append(category_areas.sum() if len(category_annotations) > 0 else 0)  # TotalArea_<category id>
-        row.append(category_areas.min() if len(category_annotations) > 0 else 0)  # MinArea_<category id>
-        row.append(category_areas.mean() if len(category_annotations) > 0 else 0)  # MeanArea_<category id>
-        row.append(category_areas.max() if len(category_annotations) > 0 else 0)  # MaxArea_<category id>
-        row.append(category_areas.std() if len(category_annotations) > 0 else 0)  # StdevArea_<category id>
-        row.append(category_bboxes[:, 0].mean() if len(category_annotations) > 0 else 0)  # MeanX_<category id>
-        row.append(category_bboxes[:, 1].mean() if len(category_annotations) > 0 else 0)  # MeanY_<category id>
-        row.append(category_bboxes[:, 0].std() if len(category_annotations) > 0 else 0)  # StdevX_<category id>
-        row.append(category_bboxes[:, 1].std() if len(category_annotations) > 0 else 0)  # StdevY_<category id>
 
-    return sep.join(map(str, row))
+def format_index_row(values: List[Any], sep=',') -> str:
+    """
+    Formats the values of an index row as a line of the CSV index.
+
+    :param values: The values of the row. See `create_index_values`.
+    :param sep: Optional separator for each column. Default is ','.
+    :return: string for the index row.
+    """
+    return row_template((len(values) - NUM_FIXED_COLUMNS) // NUM_CATEGORY_COLUMNS, sep).format(*values)
+
+
+def flatten_annotations(annotations_by_filename: Dict[str, List[Dict[str, Any]]]) \
+        -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Lays the annotations of every image out as flat parallel arrays. The annotations of `filenames[i]` are the
+    entries `offsets[i]:offsets[i + 1]` of each array.
+
+    :param annotations_by_filename: Annotations grouped by filename. See the annotations.py file.
+    :return: filenames, offsets, and the category id, area, bbox x and bbox y arrays.
+    """
+    filenames = list(annotations_by_filename)
+    offsets = np.zeros(len(filenames) + 1, dtype=np.int64)
+    np.cumsum([len(annotations) for annotations in annotations_by_filename.values()], out=offsets[1:])
+    count = int(offsets[-1])
+
+    def flat(key, dtype):
+        return np.fromiter((key(a) for annotations in annotations_by_filename.values() for a in annotations),
+                           dtype=dtype, count=count)
+
+    cids = flat(lambda a: a['category_id'], np.int64)
+    areas = flat(lambda a: a['area'], np.float64)
+    xs = flat(lambda a: a['bbox'][0], np.float64)
+    ys = flat(lambda a: a['bbox'][1], np.float64)
+
+    return filenames, offsets, cids, areas, xs, ys
+
+
+# CSV rows are written in batches of at most this many rows or characters, whichever is reached first
+ROW_BATCH_SIZE = 1024
+ROW_BATCH_CHARS = 4 << 20
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+def write_rows(fp, rows: Iterable[str]):
+    """
+    Writes rows to the CSV index, joining them into batches so each batch is a single write call.
+
+    :param fp: The text file to write to.
+    :param rows: The rows to write, without trailing newlines.
+    """
+    batch = []
+    batch_chars = 0
+    for row in rows:
+        batch.append(row)
+        batch_chars += len(row)
+        if len(batch) >= ROW_BATCH_SIZE or batch_chars >= ROW_BATCH_CHARS:
+            batch.append('')
+            fp.write('\n'.join(batch))
+            batch = []
+            batch_chars = 0
+
+    if batch:
+        batch.append('')
+        fp.write('\n'.join(batch))
+
+
+def write_parquet(output_path: str, columns: List[str], rows: List[List[Any]]):
+    """
+    Writes index rows to a zstd compressed Parquet file.
+
+    :param output_path: The path to write the index to.
+    :param columns: The column names. See `create_header_columns`.
+    :param rows: The values of each row. See `create_index_values`.
+    """
+    values_by_column = list(zip(*rows)) if rows else [()] * len(columns)
+    arrays = [pa.array(values) for values in values_by_column]
+    arrays = [array.cast(pa.int64()) if column.startswith(INTEGER_COLUMN_PREFIXES) else array
+              for column, array in zip(columns, arrays)]
+    table = pa.Table.from_arrays(arrays, names=columns)
+    pq.write_table(table, output_path, compression='zstd')
 
 
 def create_index_sequentially(output_path: str,
                               categories: List[Dict[str, Any]],
                               annotations_by_filename: Dict[str, List[Dict[str, Any]]],
-                              sep: str = ','):
+                              sep: str = ',',
+                              output_format: str = 'csv'):
     """
     Creates the index sequentially by calling `create_index_row` on all the images.
 
@@ -252,49 +455,150 @@ def create_index_sequentially(output_path: str,
     :param categories: All of the categories. A list of {'id': ..., 'name': ...} objects.
     :param annotations_by_filename: Annotations grouped by filename. See the annotations.py file.
     :param sep: Optional column separator. Default is ','.
+    :param output_format: Optional output format, either 'csv' or 'parquet'. Default is 'csv'.
     """
     category_ids = sorted([c['id'] for c in categories])
+    cid_to_row = create_category_lookup(category_ids)
 
-    with open(output_path, 'w') as fp:
+    if output_format == 'parquet':
+        rows = [create_index_values(category_ids, filename, annotations, cid_to_row=cid_to_row)
+                for filename, annotations in tqdm(annotations_by_filename.items())]
+        write_parquet(output_path, create_header_columns(category_ids), rows)
+        return
+
+    with open(output_path, 'w', buffering=WRITE_BUFFER_SIZE) as fp:
         fp.write(create_header_row(category_ids, sep=sep))
         fp.write('\n')
 
-        for filename, annotations in tqdm(annotations_by_filename.items()):
-            row = create_index_row(category_ids, filename, annotations, sep=sep)
-            fp.write(row)
-            fp.write('\n')
+        write_rows(fp, (create_index_row(category_ids, filename, annotations, sep=sep, cid_to_row=cid_to_row)
+                        for filename, annotations in tqdm(annotations_by_filename.items())))
+
+
+# the arguments shared by every job, set in each worker process by `init_worker` so they are only pickled once
+_worker_category_ids = None
+_worker_cid_to_row = None
+_worker_sep = ','
+
+# the flattened annotations (see `flatten_annotations`), attached to shared memory by `init_worker`
+_worker_shared_memory = []
+_worker_cids = None
+_worker_areas = None
+_worker_xs = None
+_worker_ys = None
+
+
+def to_shared_memory(array: np.ndarray) -> SharedMemory:
+    """
+    Copies an array into a new shared memory block. The caller is responsible for closing and unlinking it.
+
+    :param array: The array to copy.
+    :return: the shared memory block.
+    """
+    shared_memory = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shared_memory.buf)[:] = array
+    return shared_memory
+
+
+def from_shared_memory(shared_memory: SharedMemory, shape, dtype) -> np.ndarray:
+    """
+    Views a shared memory block created by `to_shared_memory` as an array.
+    """
+    return np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf)
+
+
+def init_worker(category_ids, cid_to_row, sep, shared_arrays):
+    """
+    Sets the arguments shared by every job in a worker process and attaches it to the flattened annotations.
+
+    :param category_ids: The sorted category ids.
+    :param cid_to_row: The category lookup table. See `create_category_lookup`.
+    :param sep: The column separator.
+    :param shared_arrays: A (block name, shape, dtype str) tuple for each of the cids, areas, xs, and ys arrays of
+        `flatten_annotations`, in that order, created by `to_shared_memory`. The blocks are kept referenced by the
+        worker so the arrays viewing them stay mapped.
+    """
+    global _worker_category_ids, _worker_cid_to_row, _worker_sep
+    global _worker_shared_memory, _worker_cids, _worker_areas, _worker_xs, _worker_ys
+
+    _worker_category_ids = category_ids
+    _worker_cid_to_row = cid_to_row
+    _worker_sep = sep
+
+    # keep the blocks referenced so the arrays' buffers stay mapped
+    _worker_shared_memory = [SharedMemory(name=name) for name, _, _ in shared_arrays]
+    _worker_cids, _worker_areas, _worker_xs, _worker_ys = [
+        from_shared_memory(shared_memory, shape, dtype)
+        for shared_memory, (_, shape, dtype) in zip(_worker_shared_memory, shared_arrays)
+    ]
+
+
+def wrapped_create_index_values(args):
+    filename, start, end = args
+    return create_index_values_from_arrays(
+        _worker_category_ids, filename, _worker_cids[start:end], _worker_areas[start:end], _worker_xs[start:end],
+        _worker_ys[start:end], cid_to_row=_worker_cid_to_row,
+    )
 
 
 def wrapped_create_index_row(args):
-    return create_index_row(*args)
+    return format_index_row(wrapped_create_index_values(args), sep=_worker_sep)
 
 
 def create_index_multiprocessing(output_path: str,
                                  categories: List[Dict[str, Any]],
                                  annotations_by_filename: Dict[str, List[Dict[str, Any]]],
-                                 sep: str = ','):
+                                 sep: str = ',',
+                                 output_format: str = 'csv'):
     """
-    Creates the index using multiple processes with `multiprocessing`. It calls `create_index_row` on all the images.
+    Creates the index using multiple processes with `multiprocessing`. It calls `create_index_values_from_arrays` on all
+    the images.
+
+    The annotations are flattened into arrays in shared memory, so each job only sends the workers a filename and the
+    range of its annotations. Rows are written in the order they finish, not in the order of `annotations_by_filename`.
 
     :param output_path: The path to write the index to.
     :param categories: All of the categories. A list of {'id': ..., 'name': ...} objects.
     :param annotations_by_filename: Annotations grouped by filename. See the annotations.py file.
     :param sep: Optional column separator. Default is ','.
+    :param output_format: Optional output format, either 'csv' or 'parquet'. Default is 'csv'.
     """
 
     category_ids = sorted([c['id'] for c in categories])
-
-    with open(output_path, 'w') as fp:
-        fp.write(create_header_row(category_ids, sep=sep))
-        fp.write('\n')
-
-        with multiprocessing.Pool() as pool:
-            jobs = [(category_ids, filename, annotations, sep)
-                    for filename, annotations in annotations_by_filename.items()]
-            for row in tqdm(pool.imap(wrapped_create_index_row, jobs), total=len(jobs)):
-                fp.write(row)
+    cid_to_row = create_category_lookup(category_ids)
+
+    filenames, offsets, *arrays = flatten_annotations(annotations_by_filename)
+    bounds = offsets.tolist()
+    jobs = [(filename, bounds[i], bounds[i + 1]) for i, filename in enumerate(filenames)]
+    chunksize = max(1, len(jobs) // (multiprocessing.cpu_count() * 16))
+
+    # blocks are tracked as they're created so the ones already created are unlinked if creating a later one fails,
+    # e.g. when /dev/shm is full
+    shared_memory = []
+    try:
+        for array in arrays:
+            shared_memory.append(to_shared_memory(array))
+        shared_arrays = [(block.name, array.shape, array.dtype.str) for block, array in zip(shared_memory, arrays)]
+        del arrays
+
+        with multiprocessing.Pool(initializer=init_worker,
+                                  initargs=(category_ids, cid_to_row, sep, shared_arrays)) as pool:
+            if output_format == 'parquet':
+                rows = list(tqdm(pool.imap_unordered(wrapped_create_index_values, jobs, chunksize=chunksize),
+                                 total=len(jobs)))
+                write_parquet(output_path, create_header_columns(category_ids), rows)
+                return
+
+            with open(output_path, 'w', buffering=WRITE_BUFFER_SIZE) as fp:
+                fp.write(create_header_row(category_ids, sep=sep))
                 fp.write('\n')
 
+                write_rows(fp, tqdm(pool.imap_unordered(wrapped_create_index_row, jobs, chunksize=chunksize),
+                                    total=len(jobs)))
+    finally:
+        for block in shared_memory:
+            block.close()
+            block.unlink()
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -302,6 +606,8 @@ def main():
     parser.add_argument('output_path', help='The path to output the index to.')
     parser.add_argument('--dataset', choices=['mapillary', 'isaid'], help='The dataset the JSON file is for.')
     parser.add_argument('--sep', default=',', help='The separator to use for rows. Default is `,`.')
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet'],
+                        help='The file format to write the index in. Default is `csv`.')
     args = parser.parse_args()
 
     path = args.path
@@ -319,7 +625,8 @@ def main():
 
     categories, annotations_by_filename = annotations_fn(args.path)
 
-    create_index_multiprocessing(args.output_path, categories, annotations_by_filename, sep=args.sep)
+    create_index_multiprocessing(args.output_path, categories, annotations_by_filename, sep=args.sep,
+                                 output_format=args.format)
 
 
 if __name__ == '__main__':
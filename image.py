@@ -12,11 +12,101 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import numpy as np
 import json
 from typing import Optional, List, Dict, Any
 
+# libjpeg-turbo and libvips decode faster than PIL, but both need native libraries, so PIL is the fallback
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJCS_RGB, TJCS_YCbCr
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    turbo_jpeg = None
+
+try:
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+JPEG_EXTENSIONS = ('.jpg', '.jpeg')
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+PNG_EXTENSIONS = ('.png',)
+
+# the TIFF photometric interpretations that PIL returns without converting the samples
+TIFF_PHOTOMETRICS = (1, 2, 3)  # MINISBLACK, RGB, PALETTE
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# the PNG color types that libvips and PIL both decode to the same bands: grayscale, RGB, grayscale + alpha and RGBA
+VIPS_PNG_COLOR_TYPES = (0, 2, 4, 6)
+
+
+def tiff_memmaps_like_pil(image_path: str) -> bool:
+    """
+    Checks whether memory-mapping a TIFF with tifffile returns the same array as PIL.
+
+    That's the case for single page, uncompressed 8 bit grayscale, RGB(A) and palette TIFFs with contiguous samples.
+    tifffile returns planar TIFFs as [samples, height, width] and stacks multi-page TIFFs, where PIL returns
+    [height, width, samples] and only the first page.
+
+    :param image_path: The path to the TIFF.
+    :return: whether the TIFF can be memory-mapped.
+    """
+    try:
+        with tifffile.TiffFile(image_path) as tiff:
+            if len(tiff.pages) != 1:
+                return False
+            page = tiff.pages[0]
+            return (page.is_contiguous and page.bitspersample == 8
+                    and page.photometric in TIFF_PHOTOMETRICS
+                    and (page.samplesperpixel == 1 or page.planarconfig == tifffile.PLANARCONFIG.CONTIG))
+    except tifffile.TiffFileError:
+        return False
+
+
+def png_decodes_like_pil(image_path: str) -> bool:
+    """
+    Checks whether libvips decodes a PNG to the same array as PIL by reading its chunks up to the image data.
+
+    That's the case for 8 bit grayscale, RGB and alpha PNGs without a tRNS chunk. libvips expands palettes to RGB
+    where PIL returns the palette indices, which are the class ids of label PNGs, and expands tRNS chunks to an alpha
+    band where PIL returns none. PIL also returns other bit depths as different types.
+
+    :param image_path: The path to the PNG.
+    :return: whether the PNG can be decoded with libvips.
+    """
+    with open(image_path, 'rb') as fp:
+        if fp.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+            return False
+
+        while True:
+            header = fp.read(8)
+            if len(header) < 8:
+                return False
+            length, chunk_type = struct.unpack('>I4s', header)
+
+            if chunk_type == b'IHDR':
+                bit_depth, color_type = fp.read(length)[8:10]
+                if bit_depth != 8 or color_type not in VIPS_PNG_COLOR_TYPES:
+                    return False
+                length = 0
+            elif chunk_type == b'tRNS':
+                return False
+            elif chunk_type == b'IDAT':
+                return True
+
+            # skip the chunk's data and CRC
+            fp.seek(length + 4, os.SEEK_CUR)
+
 
 class COCOImage(object):
     """
@@ -27,9 +117,12 @@ class COCOImage(object):
         # create the object
         coco_image = COCOImage('path/to/image.png', 'path/to/annotations.json')
 
-        # access the actual image data as a numpy array
+        # access the actual image data as a numpy array, which is loaded the first time it's accessed
         coco_image.image
 
+        # or decode the image on a thread while the annotations are parsed, so it's loaded when the object is created
+        coco_image = COCOImage('path/to/image.png', 'path/to/annotations.json', prefetch_image=True)
+
         # print the mean x coordinate for all instances in this image
         print(coco_image.bboxes[:, 0].mean())
 
@@ -39,6 +132,28 @@ class COCOImage(object):
 
     @staticmethod
     def load_image(image_path: str) -> np.ndarray:
+        """
+        Decodes JPEGs with libjpeg-turbo and PNGs with libvips when they are installed, otherwise uses PIL. Images that
+        they wouldn't decode to the same array as PIL, like grayscale JPEGs or palette PNGs, are decoded with PIL.
+
+        Uncompressed TIFFs are memory-mapped with tifffile when it is installed instead of being read into memory, if
+        their layout matches PIL's. See `tiff_memmaps_like_pil`.
+        """
+        extension = os.path.splitext(image_path)[1].lower()
+
+        if extension in TIFF_EXTENSIONS and tifffile is not None and tiff_memmaps_like_pil(image_path):
+            return tifffile.memmap(image_path, page=0, mode='r')
+
+        if extension in JPEG_EXTENSIONS and turbo_jpeg is not None:
+            with open(image_path, 'rb') as fp:
+                data = fp.read()
+            # PIL returns grayscale JPEGs with a single band and CMYK JPEGs with 4
+            if turbo_jpeg.decode_header(data)[3] in (TJCS_RGB, TJCS_YCbCr):
+                return turbo_jpeg.decode(data, pixel_format=TJPF_RGB)
+
+        if extension in PNG_EXTENSIONS and pyvips is not None and png_decodes_like_pil(image_path):
+            return pyvips.Image.new_from_file(image_path, access='sequential').numpy()
+
         return np.asarray(Image.open(image_path))
 
     @staticmethod
@@ -46,28 +161,56 @@ class COCOImage(object):
         with open(annotations_path) as fp:
             return json.load(fp)['annotations']
 
-    def __init__(self, image_path: str, annotations_path: str, load_image=True, load_annotations=True):
+    def __init__(self, image_path: str, annotations_path: str, load_image=True, load_annotations=True,
+                 prefetch_image=False):
         self.image_path = image_path
         self.annotations_path = annotations_path
 
-        if load_image:
-            self.image = self.load_image(image_path)
+        # the image is decoded by the `image` property the first time it's accessed
+        self._image: Optional[np.ndarray] = None if load_image else np.array([])
+
+        if load_image and prefetch_image:
+            # the decoders release the GIL, so the image is decoded while the annotations are parsed. The executor
+            # only lives as long as the decode, so no threads are left running, e.g. when the process forks
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix='COCOImage') as executor:
+                image = executor.submit(self.load_image, image_path)
+                self._parse_annotations(load_annotations)
+                self._image = image.result()
         else:
-            self.image = np.array([])
+            self._parse_annotations(load_annotations)
 
+    def _parse_annotations(self, load_annotations: bool):
         if load_annotations:
-            self.annotations = self.load_annotations(annotations_path)
+            self.annotations = self.load_annotations(self.annotations_path)
         else:
             self.annotations = []
 
+        n = len(self.annotations)
+
         # a [N, 4] numpy array consisting of [x, y, w, h] coordinates for each instance's bounding boxes
-        self.bboxes: np.ndarray = np.array([a['bbox'] for a in self.annotations])
+        self.bboxes: np.ndarray = np.empty((n, 4), dtype=np.float32)
 
         # a [N,] numpy array consisting of the category ids of each instance
-        self.category_ids: np.ndarray = np.array([a['category_id'] for a in self.annotations])
+        self.category_ids: np.ndarray = np.empty(n, dtype=np.int32)
 
         # a [N,] numpy array consisting of the areas of each instance
-        self.areas: np.ndarray = np.array([a['area'] for a in self.annotations])
+        self.areas: np.ndarray = np.empty(n, dtype=np.float32)
 
         # a [N,] numpy array consisting of 0 or 1 indicating whether the instance is part of a crowd
-        self.is_crowds: np.ndarray = np.array([a['iscrowd'] for a in self.annotations])
+        self.is_crowds: np.ndarray = np.empty(n, dtype=np.uint8)
+
+        for i, a in enumerate(self.annotations):
+            self.bboxes[i] = a['bbox']
+            self.category_ids[i] = a['category_id']
+            self.areas[i] = a['area']
+            self.is_crowds[i] = a['iscrowd']
+
+    @property
+    def image(self) -> np.ndarray:
+        if self._image is None:
+            self._image = self.load_image(self.image_path)
+        return self._image
+
+    @image.setter
+    def image(self, image: np.ndarray):
+        self._image = image
@@ -12,17 +12,45 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import List, Set, Optional
+from typing import List, Set, Optional, FrozenSet, Dict
+import numpy as np
+import numba
 import pandas as pd
+import pyarrow.parquet as pq
 
 ImageId = str
 ClassId = int
 
+# stands in for a missing lower or upper bound of get_images_with_bounded_num_instances
+NO_LOWER_BOUND = np.iinfo(np.int64).min
+NO_UPPER_BOUND = np.iinfo(np.int64).max
+
+
+@numba.njit(cache=True, boundscheck=False)
+def _bounded_mask(counts, columns, lower, upper):
+    """
+    Gets a boolean mask of the rows of `counts` where lower <= counts[row, column] < upper for every column in
+    `columns`, stopping at the first column of a row that is out of bounds.
+    """
+    mask = np.ones(counts.shape[0], dtype=np.bool_)
+    for row in range(counts.shape[0]):
+        for column in columns:
+            count = counts[row, column]
+            # NaN counts compare false, so they're out of bounds
+            if not (lower <= count < upper):
+                mask[row] = False
+                break
+    return mask
+
 
 class COCOIndex:
     """
     Index into COCO dataset images.
 
+    Indexes written with `create_index.py --format parquet` are loaded when the path ends with `.parquet`. Only the
+    ImageID and NumInstances_<class id> columns, which are the ones queried, are kept in memory. `load` reads the index
+    with all of its stats columns.
+
     Example Usage: ::
 
         index = COCOIndex('/path/to/index.csv')
@@ -46,44 +74,162 @@ class COCOIndex:
         index.keep(image_ids_2)
     """
 
+    __slots__ = (
+        '_path', '_index', '_images', '_counts', '_image_codes', '_image_categories', '_classes_cache',
+        '_columns_cache', '_positions_cache',
+    )
+
     def __init__(self, path: str, load=True):
         self._path = path
 
-        self._index = None
+        # keep and remove only drop rows, so the columns and therefore the classes never change once computed
+        self._classes_cache: Optional[FrozenSet[ClassId]] = None
+        self._columns_cache: Optional[Dict[ClassId, str]] = None
+        self._positions_cache: Optional[Dict[ClassId, int]] = None
+
+        # the arrays the queries run on, refreshed by _set_index whenever the DataFrame is replaced
+        self._index: Optional[pd.DataFrame] = None
+        self._counts: Optional[np.ndarray] = None
+        self._image_codes: Optional[np.ndarray] = None
+        self._image_categories: Optional[np.ndarray] = None
+
+        # the ImageIds remaining in the index, computed by get_images and reset by _set_index
+        self._images: Optional[FrozenSet[ImageId]] = None
+
         if load:
-            self._index = self.load()
+            # only the queried columns are read, the stats columns can be loaded with `load`
+            self._set_index(self.load(self._queried_columns()))
 
-    def load(self) -> pd.DataFrame:
-        return pd.read_csv(self._path)
+    @classmethod
+    def _from_columns(cls, columns: Dict[str, np.ndarray]) -> 'COCOIndex':
+        """
+        Creates an index from a dictionary of column name to column array instead of loading it from a file.
+        """
+        index = cls('', load=False)
+        index._set_index(pd.DataFrame(columns, copy=False))
+        return index
 
-    def _true_selector(self) -> pd.Series:
-        return self._index.ImageID != ''
+    @staticmethod
+    def _is_queried_column(column: str) -> bool:
+        return column == 'ImageID' or column.startswith('NumInstances_')
+
+    def _queried_columns(self) -> List[str]:
+        """
+        Gets the ImageID and NumInstances_<class id> columns of the index file, which are the only ones queried.
+        """
+        if self._path.endswith('.parquet'):
+            columns = pq.read_schema(self._path).names
+        else:
+            columns = pd.read_csv(self._path, nrows=0).columns
+        return [c for c in columns if self._is_queried_column(c)]
+
+    def load(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Loads the index file.
+
+        :param columns: Optional names of the columns to load. Default is all of them.
+        :return: the index.
+        """
+        if self._path.endswith('.parquet'):
+            return pd.read_parquet(self._path, engine='pyarrow', columns=columns)
+        # read ImageIDs as they are, otherwise ones like `NA` or `nan` would be read as missing values
+        return pd.read_csv(self._path, usecols=columns, converters={'ImageID': str})
+
+    def _set_index(self, index: pd.DataFrame):
+        """
+        Replaces the index DataFrame and extracts the arrays the queries run on from it, so that queries never look up
+        DataFrame columns:
+
+            _counts: the C-contiguous [num images, num classes] matrix of the NumInstances_<class id> columns, ordered
+                by `_num_instances_positions` and narrowed to the smallest integer type that holds the counts
+            _image_codes, _image_categories: the categorical ImageID's integer codes and the ImageIds they map to
+        """
+        # as a categorical, ImageID membership tests compare integer codes instead of hashing strings
+        if not isinstance(index.ImageID.dtype, pd.CategoricalDtype):
+            index = index.astype({'ImageID': 'category'})
+        self._index = index
+        self._images = None
 
-    def _false_selector(self) -> pd.Series:
-        return self._index.ImageID == ''
+        counts = index[list(self._num_instances_columns.values())].to_numpy()
+        if counts.size and np.issubdtype(counts.dtype, np.integer) and counts.min() >= 0:
+            counts = counts.astype(np.min_scalar_type(counts.max()))
+        self._counts = np.ascontiguousarray(counts)
+
+        self._image_codes = index.ImageID.cat.codes.to_numpy()
+        self._image_categories = index.ImageID.cat.categories.to_numpy()
+
+    @property
+    def classes(self) -> FrozenSet[ClassId]:
+        """
+        The ClassIds that are in the index.
+        """
+        if self._classes_cache is None:
+            self._classes_cache = frozenset(
+                int(c.split('_', 1)[1]) for c in self._index.columns if c.startswith('NumInstances_')
+            )
+        return self._classes_cache
+
+    @property
+    def _num_instances_columns(self) -> Dict[ClassId, str]:
+        if self._columns_cache is None:
+            self._columns_cache = {class_id: f'NumInstances_{class_id}' for class_id in self.classes}
+        return self._columns_cache
+
+    @property
+    def _num_instances_positions(self) -> Dict[ClassId, int]:
+        if self._positions_cache is None:
+            self._positions_cache = {class_id: i for i, class_id in enumerate(self._num_instances_columns)}
+        return self._positions_cache
+
+    def _count_columns(self, classes: List[ClassId]) -> np.ndarray:
+        """
+        Gets the columns of `_counts` that hold the num instances of `classes`.
+        """
+        positions = self._num_instances_positions
+        return np.array([positions[class_id] for class_id in classes], dtype=np.intp)
+
+    def _image_selector(self, image_ids: Set[ImageId]) -> np.ndarray:
+        """
+        Gets a boolean mask of the rows whose ImageID is in `image_ids`.
+        """
+        codes = self._index.ImageID.cat.categories.get_indexer(list(image_ids))
+        return np.isin(self._image_codes, self._present_codes(codes))
+
+    @staticmethod
+    def _present_codes(codes: np.ndarray) -> np.ndarray:
+        """
+        Drops the -1 codes of missing ImageIDs, or of ImageIDs that aren't categories, which would otherwise index the
+        last category.
+        """
+        return codes[codes >= 0]
+
+    def _selected_images(self, selector: np.ndarray) -> Set[ImageId]:
+        """
+        Gets the set of ImageIds of the rows selected by the boolean mask `selector`. The rows are selected by their
+        integer ImageID codes, which are only mapped back to strings to build the set.
+        """
+        return set(self._image_categories[self._present_codes(self._image_codes[selector])])
 
     def get_images(self) -> Set[ImageId]:
         """
         Gets the set of ImageIds that are still remaining in the index.
         """
-        return set(self._index.ImageID)
+        if self._images is None:
+            self._images = frozenset(self._image_categories[self._present_codes(np.unique(self._image_codes))])
+        return set(self._images)
 
     def get_classes(self) -> Set[ClassId]:
         """
         Gets the set of ClassIds that are in the index.
         """
-        return set(int(c.split('_')[1]) for c in self._index.columns if 'NumInstances_' in c)
+        return set(self.classes)
 
     def get_images_with_classes(self, classes: List[ClassId]) -> Set[ImageId]:
         """
         Gets all images with at least 1 class from the `class_ids` parameter.
         """
-        selector = self._false_selector()
-
-        for class_id in classes:
-            selector |= self._index[f'NumInstances_{class_id}'] > 0
-
-        return set(self._index[selector].ImageID)
+        selector = (self._counts[:, self._count_columns(classes)] > 0).any(axis=1)
+        return self._selected_images(selector)
 
     def get_images_with_bounded_num_instances(
             self, classes: List[ClassId], lower: Optional[int] = None, upper: Optional[int] = None
@@ -93,24 +239,22 @@ class COCOIndex:
 
             lower <= NumInstances_{class_id} < upper
         """
-        selector = self._true_selector()
-
-        for class_id in classes:
-            if lower is not None:
-                selector &= (self._index[f'NumInstances_{class_id}'] >= lower)
-            if upper is not None:
-                selector &= (self._index[f'NumInstances_{class_id}'] < upper)
-
-        return set(self._index[selector].ImageID)
+        selector = _bounded_mask(
+            self._counts,
+            self._count_columns(classes),
+            NO_LOWER_BOUND if lower is None else lower,
+            NO_UPPER_BOUND if upper is None else upper,
+        )
+        return self._selected_images(selector)
 
     def keep(self, image_ids: Set[ImageId]):
         """
         Keep only the image ids specified in the parameter.
         """
-        self._index = self._index[self._index.ImageID.isin(image_ids)]
+        self._set_index(self._index[self._image_selector(image_ids)])
 
     def remove(self, image_ids: Set[ImageId]):
         """
         Remove only the image ids specified in the parameter.
         """
-        self._index = self._index[~self._index.ImageID.isin(image_ids)]
+        self._set_index(self._index[~self._image_selector(image_ids)])
@@ -12,13 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
+import orjson
+import lmdb
 import argparse
 import os
 import multiprocessing
 from tqdm import tqdm
 from annotations import mapillary_annotations, isaid_annotations
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 
 def save_annotations(output_dir: str, filename: str, annotations: List[Dict[str, Any]]):
@@ -29,10 +30,10 @@ def save_annotations(output_dir: str, filename: str, annotations: List[Dict[str,
     :param filename: The filename of image.
     :param annotations: The list of annotations
     """
-    with open(os.path.join(output_dir, os.path.splitext(filename)[0] + '.json'), 'w') as fp:
-        json.dump({
+    with open(os.path.join(output_dir, os.path.splitext(filename)[0] + '.json'), 'wb') as fp:
+        fp.write(orjson.dumps({
             'annotations': annotations
-        }, fp)
+        }))
     return filename
 
 
@@ -68,11 +69,68 @@ def split_multiprocessing(output_dir: str, annotations_by_filename: Dict[str, Li
             pass
 
 
+# the number of images written to the LMDB database per write transaction
+LMDB_BATCH_SIZE = 10000
+LMDB_MAP_SIZE = 1 << 34
+
+
+def encode_annotations(filename: str, annotations: List[Dict[str, Any]]) -> Tuple[bytes, bytes]:
+    """
+    Encodes a collection of annotations for a single image as an LMDB key and value.
+
+    :param filename: The filename of image.
+    :param annotations: The list of annotations
+    :return: the filename without its extension, and the same JSON document `save_annotations` writes.
+    """
+    return os.path.splitext(filename)[0].encode(), orjson.dumps({
+        'annotations': annotations
+    })
+
+
+def wrapped_encode_annotations(args):
+    return encode_annotations(*args)
+
+
+def write_lmdb_batch(env: lmdb.Environment, batch: List[Tuple[bytes, bytes]]):
+    """
+    Writes a batch of encoded annotations to the LMDB database in a single transaction.
+    """
+    with env.begin(write=True) as txn:
+        for key, value in batch:
+            txn.put(key, value)
+
+
+def split_lmdb(output_dir: str, annotations_by_filename: Dict[str, List[Dict[str, Any]]]):
+    """
+    Splits the annotations into a single LMDB database instead of one file per image. The annotations are encoded using
+    multiple processes with `multiprocessing` by calling `encode_annotations`, and are written by this process.
+
+    :param output_dir: The directory to create the LMDB database in.
+    :param annotations_by_filename: The dictionary of annotations. See annotations.py file.
+    """
+
+    env = lmdb.open(output_dir, map_size=LMDB_MAP_SIZE)
+    try:
+        with multiprocessing.Pool() as pool:
+            jobs = [(filename, annotations) for filename, annotations in annotations_by_filename.items()]
+            batch = []
+            for item in tqdm(pool.imap_unordered(wrapped_encode_annotations, jobs), total=len(jobs)):
+                batch.append(item)
+                if len(batch) >= LMDB_BATCH_SIZE:
+                    write_lmdb_batch(env, batch)
+                    batch = []
+            write_lmdb_batch(env, batch)
+    finally:
+        env.close()
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('path', help='The path to the single JSON file containing COCO style annotations.')
     parser.add_argument('output_dir', help='The directory to output the annotations to')
     parser.add_argument('--dataset', choices=['mapillary', 'isaid'], help='The dataset the JSON file is for.')
+    parser.add_argument('--format', default='files', choices=['files', 'lmdb'],
+                        help='Write a JSON file per image, or a single LMDB database. Default is `files`.')
     args = parser.parse_args()
 
     path = args.path
@@ -92,7 +150,10 @@ def main():
 
     categories, annotations_by_filename = annotations_fn(args.path)
 
-    split_multiprocessing(args.output_dir, annotations_by_filename)
+    if args.format == 'lmdb':
+        split_lmdb(args.output_dir, annotations_by_filename)
+    else:
+        split_multiprocessing(args.output_dir, annotations_by_filename)
 
 
 if __name__ == '__main__':
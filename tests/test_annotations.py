@@ -0,0 +1,94 @@
+import json
+import pytest
+from unittest import mock
+from annotations import SIMDJSON_MAX_SIZE, isaid_annotations, mapillary_annotations
+
+
+CATEGORIES = [
+    {'id': 1, 'name': 'storage_tank', 'supercategory': 'object'},
+    {'id': 2, 'name': 'ship', 'supercategory': 'object'},
+]
+
+ISAID = {
+    'images': [
+        {'id': 0, 'file_name': 'P0000.png', 'width': 800, 'height': 600},
+        {'id': 1, 'file_name': 'P0001.png', 'width': 800, 'height': 600},
+    ],
+    'annotations': [
+        {'id': 0, 'image_id': 1, 'segmentation': [[244.0, 1602.0, 306.0, 1602.0, 306.0, 1653.0]], 'category_id': 1,
+         'category_name': 'storage_tank', 'iscrowd': 0, 'area': 2580, 'bbox': [244.0, 1602.0, 62.0, 51.0]},
+        {'id': 1, 'image_id': 0, 'segmentation': [[1.5, 2.5, 3.5, 4.5, 5.5, 6.5]], 'category_id': 2,
+         'category_name': 'ship', 'iscrowd': 1, 'area': 12.25, 'bbox': [1.5, 2.5, 4.0, 4.0]},
+        {'id': 2, 'image_id': 1, 'segmentation': [[0.0, 0.0, 1.0, 0.0, 1.0, 1.0]], 'category_id': 2,
+         'category_name': 'ship', 'iscrowd': 0, 'area': 0.5, 'bbox': [0.0, 0.0, 1.0, 1.0]},
+    ],
+    'categories': CATEGORIES,
+}
+
+MAPILLARY = {
+    'images': [{'id': 'a', 'file_name': 'a.jpg'}, {'id': 'b', 'file_name': 'b.jpg'}],
+    'annotations': [
+        {'image_id': 'a', 'file_name': 'a.png', 'segments_info': [
+            {'area': 52387, 'category_id': 1, 'iscrowd': 0, 'id': 4409415, 'bbox': [0, 1838, 3264, 525]},
+            {'area': 10, 'category_id': 2, 'iscrowd': 1, 'id': 1, 'bbox': [1, 2, 3, 4]},
+        ]},
+        {'image_id': 'b', 'file_name': 'b.png', 'segments_info': []},
+    ],
+    'categories': CATEGORIES,
+}
+
+
+def write_json(tmp_path, obj) -> str:
+    path = tmp_path / 'annotations.json'
+    path.write_text(json.dumps(obj))
+    return str(path)
+
+
+def expected_isaid(path):
+    with open(path) as fp:
+        obj = json.load(fp)
+    filename_by_image_id = {i['id']: i['file_name'] for i in obj['images']}
+    annotations_by_filename = {}
+    for a in obj['annotations']:
+        annotations_by_filename.setdefault(filename_by_image_id[a['image_id']], []).append(a)
+    return obj['categories'], annotations_by_filename
+
+
+def expected_mapillary(path):
+    with open(path) as fp:
+        obj = json.load(fp)
+    return obj['categories'], {a['file_name']: a['segments_info'] for a in obj['annotations']}
+
+
+def assert_plain_json(value):
+    """
+    Asserts that `value` is made of plain python objects, not simdjson proxies.
+    """
+    assert type(value) in (dict, list, str, int, float, bool, type(None)), type(value)
+    if isinstance(value, dict):
+        for v in value.values():
+            assert_plain_json(v)
+    elif isinstance(value, list):
+        for v in value:
+            assert_plain_json(v)
+
+
+@pytest.mark.parametrize(('annotations_fn', 'expected_fn', 'obj'), [
+    (isaid_annotations, expected_isaid, ISAID),
+    (mapillary_annotations, expected_mapillary, MAPILLARY),
+])
+# a max size of 0 makes every file too large for simdjson, so they're parsed with orjson
+@pytest.mark.parametrize('simdjson_max_size', [SIMDJSON_MAX_SIZE, 0])
+def test_annotations_like_json_load(tmp_path, annotations_fn, expected_fn, obj, simdjson_max_size):
+    path = write_json(tmp_path, obj)
+    with mock.patch('annotations.SIMDJSON_MAX_SIZE', simdjson_max_size):
+        categories, annotations_by_filename = annotations_fn(path)
+    expected_categories, expected_annotations_by_filename = expected_fn(path)
+
+    assert type(categories) is list
+    assert type(annotations_by_filename) is dict
+    assert_plain_json(categories)
+    assert_plain_json(annotations_by_filename)
+
+    assert categories == expected_categories
+    assert annotations_by_filename == expected_annotations_by_filename
@@ -0,0 +1,143 @@
+import os
+import tempfile
+from multiprocessing.shared_memory import SharedMemory
+from unittest import TestCase, mock
+import create_index as create_index_module
+from create_index import (
+    create_header_row, create_index_row, create_index_sequentially, create_index_multiprocessing,
+)
+import numpy as np
+import pyarrow.parquet as pq
+
+
+class CreateIndexRowTestCase(TestCase):
+    def setUp(self):
+        self.category_ids = [1, 2, 3]
+        self.annotations = [
+            {'category_id': 2, 'area': 10, 'bbox': [0.0, 4.0, 1.0, 1.0]},
+            {'category_id': 1, 'area': 4, 'bbox': [2.0, 0.0, 1.0, 1.0]},
+            {'category_id': 2, 'area': 30, 'bbox': [4.0, 8.0, 1.0, 1.0]},
+        ]
+        header = create_header_row(self.category_ids).split(',')
+        values = create_index_row(self.category_ids, 'image.png', self.annotations).split(',')
+        self.row = dict(zip(header, values))
+        self.assertEqual(len(header), len(values))
+
+    def assertColumnEqual(self, column, expected):
+        self.assertAlmostEqual(float(self.row[column]), expected)
+
+    def test_totals(self):
+        self.assertEqual(self.row['ImageID'], 'image')
+        self.assertColumnEqual('NumInstances', 3)
+        self.assertColumnEqual('NumCategories', 2)
+        self.assertColumnEqual('TotalArea', 44)
+        self.assertColumnEqual('MinArea', 4)
+        self.assertColumnEqual('MeanArea', 44 / 3)
+        self.assertColumnEqual('MaxArea', 30)
+        self.assertColumnEqual('StdevArea', np.std([10, 4, 30]))
+        self.assertColumnEqual('MeanX', 2)
+        self.assertColumnEqual('MeanY', 4)
+        self.assertColumnEqual('StdevX', np.std([0, 2, 4]))
+        self.assertColumnEqual('StdevY', np.std([4, 0, 8]))
+
+    def test_highest_and_lowest(self):
+        self.assertColumnEqual('Highest_NumInstances', 2)
+        self.assertColumnEqual('Highest_MinArea', 10)
+        self.assertColumnEqual('Highest_StdevArea', 10)
+        self.assertColumnEqual('Lowest_NumInstances', 1)
+        self.assertColumnEqual('Lowest_MaxArea', 4)
+        self.assertColumnEqual('Lowest_StdevArea', 0)
+        self.assertColumnEqual('CategoryOf_Highest_TotalArea', 2)
+        self.assertColumnEqual('CategoryOf_Lowest_MeanArea', 1)
+
+    def test_per_category(self):
+        self.assertColumnEqual('NumInstances_2', 2)
+        self.assertColumnEqual('TotalArea_2', 40)
+        self.assertColumnEqual('MeanArea_2', 20)
+        self.assertColumnEqual('StdevArea_2', 10)
+        self.assertColumnEqual('MeanX_2', 2)
+        self.assertColumnEqual('StdevY_2', 2)
+        self.assertColumnEqual('MeanY_1', 0)
+
+    def test_integer_columns(self):
+        # the counts and category ids are formatted as integers, not floats
+        self.assertEqual(self.row['NumInstances'], '3')
+        self.assertEqual(self.row['NumCategories'], '2')
+        self.assertEqual(self.row['NumInstances_2'], '2')
+        self.assertEqual(self.row['NumInstances_3'], '0')
+        self.assertEqual(self.row['Highest_NumInstances'], '2')
+        self.assertEqual(self.row['CategoryOf_Highest_TotalArea'], '2')
+        self.assertEqual(self.row['CategoryOf_Lowest_MeanArea'], '1')
+
+    def test_brace_separator(self):
+        # the separator is part of the cached format string, so its braces have to be escaped
+        header = create_header_row(self.category_ids, sep='{}').split('{}')
+        values = create_index_row(self.category_ids, 'image.png', self.annotations, sep='{}').split('{}')
+        self.assertDictEqual(dict(zip(header, values)), self.row)
+
+    def test_empty_category(self):
+        for column in ['NumInstances_3', 'TotalArea_3', 'MinArea_3', 'MeanArea_3', 'MaxArea_3', 'StdevArea_3',
+                       'MeanX_3', 'MeanY_3', 'StdevX_3', 'StdevY_3']:
+            self.assertColumnEqual(column, 0)
+
+
+class CreateIndexMultiprocessingTestCase(TestCase):
+    def setUp(self):
+        self.categories = [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}, {'id': 5, 'name': 'c'}]
+        rng = np.random.default_rng(0)
+        self.annotations_by_filename = {
+            f'image{i}.png': [
+                {'category_id': int(rng.choice([1, 2, 5])), 'area': int(rng.integers(1, 100)),
+                 'bbox': rng.uniform(0, 50, 4).tolist()}
+                for _ in range(rng.integers(1, 8))
+            ]
+            for i in range(40)
+        }
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def create_indexes(self, extension):
+        paths = []
+        for create_index in [create_index_sequentially, create_index_multiprocessing]:
+            path = os.path.join(self.tmp.name, f'{create_index.__name__}.{extension}')
+            create_index(path, self.categories, self.annotations_by_filename, output_format=extension)
+            paths.append(path)
+        return paths
+
+    def test_csv_matches_sequential(self):
+        sequential, parallel = self.create_indexes('csv')
+        with open(sequential) as fp:
+            sequential_header, *sequential_rows = fp.read().splitlines()
+        with open(parallel) as fp:
+            parallel_header, *parallel_rows = fp.read().splitlines()
+
+        self.assertEqual(parallel_header, sequential_header)
+        # the rows are written in the order they finish
+        self.assertListEqual(sorted(parallel_rows), sorted(sequential_rows))
+
+    def test_parquet_matches_sequential(self):
+        sequential, parallel = self.create_indexes('parquet')
+        sequential, parallel = pq.read_table(sequential), pq.read_table(parallel)
+
+        self.assertEqual(parallel.schema, sequential.schema)
+        self.assertEqual(parallel.sort_by('ImageID'), sequential.sort_by('ImageID'))
+
+    def test_shared_memory_unlinked_on_failure(self):
+        created = []
+        create_shared_memory = create_index_module.to_shared_memory
+
+        # creating the second block fails, as it would when /dev/shm is full
+        def to_shared_memory(array):
+            if created:
+                raise OSError('No space left on device')
+            created.append(create_shared_memory(array))
+            return created[-1]
+
+        path = os.path.join(self.tmp.name, 'index.csv')
+        with mock.patch('create_index.to_shared_memory', side_effect=to_shared_memory):
+            with self.assertRaises(OSError):
+                create_index_multiprocessing(path, self.categories, self.annotations_by_filename)
+
+        self.assertEqual(len(created), 1)
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name=created[0].name)
@@ -0,0 +1,214 @@
+import json
+import threading
+import multiprocessing
+from unittest import mock
+import numpy as np
+import pytest
+from PIL import Image
+import image
+from image import COCOImage, png_decodes_like_pil
+
+try:
+    import turbojpeg
+except ImportError:
+    turbojpeg = None
+
+requires_turbojpeg = pytest.mark.skipif(turbojpeg is None, reason='PyTurboJPEG is not installed')
+
+
+def save(tmp_path, filename, mode, **kwargs) -> str:
+    """
+    Saves a random 8 x 10 image with the PIL `mode` and returns its path.
+    """
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    pixels = np.random.default_rng(0).integers(0, 256, (8, 10, bands), dtype=np.uint8)
+    pil_image = Image.fromarray(pixels[:, :, 0] if bands == 1 else pixels).convert(mode)
+    path = str(tmp_path / filename)
+    pil_image.save(path, **kwargs)
+    return path
+
+
+def assert_loads_like_pil(path):
+    expected = np.asarray(Image.open(path))
+    actual = COCOImage.load_image(path)
+    assert actual.shape == expected.shape
+    assert actual.dtype == expected.dtype
+    np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+def test_png_decodes_like_pil(tmp_path, mode):
+    assert png_decodes_like_pil(save(tmp_path, f'{mode}.png', mode))
+
+
+@pytest.mark.parametrize(('filename', 'mode', 'kwargs'), [
+    ('P.png', 'P', {}),
+    ('1.png', '1', {}),
+    ('I16.png', 'I;16', {}),
+    ('tRNS.png', 'RGB', {'transparency': (0, 0, 0)}),
+    ('RGB.jpg', 'RGB', {}),
+])
+def test_png_does_not_decode_like_pil(tmp_path, filename, mode, kwargs):
+    assert not png_decodes_like_pil(save(tmp_path, filename, mode, **kwargs))
+
+
+@pytest.mark.parametrize(('filename', 'mode'), [
+    ('RGB.jpg', 'RGB'), ('L.jpg', 'L'), ('P.png', 'P'), ('RGBA.png', 'RGBA'), ('RGB.tif', 'RGB'),
+])
+def test_pil(tmp_path, filename, mode):
+    path = save(tmp_path, filename, mode)
+    with mock.patch('image.turbo_jpeg', None), mock.patch('image.pyvips', None), mock.patch('image.tifffile', None):
+        assert_loads_like_pil(path)
+
+
+def test_vips_skips_palette_png(tmp_path):
+    path = save(tmp_path, 'P.png', 'P')
+    with mock.patch('image.pyvips') as pyvips:
+        assert_loads_like_pil(path)
+    pyvips.Image.new_from_file.assert_not_called()
+
+
+def test_vips_decodes_rgb_png(tmp_path):
+    path = save(tmp_path, 'RGB.png', 'RGB')
+    with mock.patch('image.pyvips') as pyvips:
+        COCOImage.load_image(path)
+    pyvips.Image.new_from_file.assert_called_once_with(path, access='sequential')
+
+
+@requires_turbojpeg
+@pytest.mark.parametrize('colorspace', ['TJCS_GRAY', 'TJCS_CMYK', 'TJCS_YCCK'])
+def test_turbo_jpeg_skips_non_color(tmp_path, colorspace):
+    path = save(tmp_path, 'L.jpg', 'L')
+    with mock.patch('image.turbo_jpeg') as turbo_jpeg:
+        turbo_jpeg.decode_header.return_value = (10, 8, 0, getattr(turbojpeg, colorspace))
+        assert_loads_like_pil(path)
+    turbo_jpeg.decode.assert_not_called()
+
+
+@requires_turbojpeg
+@pytest.mark.parametrize('colorspace', ['TJCS_RGB', 'TJCS_YCbCr'])
+def test_turbo_jpeg_decodes_color(tmp_path, colorspace):
+    path = save(tmp_path, 'RGB.jpg', 'RGB')
+    with mock.patch('image.turbo_jpeg') as turbo_jpeg:
+        turbo_jpeg.decode_header.return_value = (10, 8, 0, getattr(turbojpeg, colorspace))
+        COCOImage.load_image(path)
+    turbo_jpeg.decode.assert_called_once()
+
+
+@pytest.mark.skipif(image.turbo_jpeg is None, reason='libjpeg-turbo is not installed')
+@pytest.mark.parametrize('mode', ['RGB', 'L', 'CMYK'])
+def test_turbo_jpeg_like_pil(tmp_path, mode):
+    # libjpeg-turbo and PIL's libjpeg may use different IDCTs, so only the layout is compared exactly
+    path = save(tmp_path, f'{mode}.jpg', mode)
+    expected = np.asarray(Image.open(path))
+    actual = COCOImage.load_image(path)
+    assert actual.shape == expected.shape
+    assert actual.dtype == expected.dtype
+    np.testing.assert_allclose(actual, expected, atol=2)
+
+
+@pytest.mark.skipif(image.pyvips is None, reason='libvips is not installed')
+@pytest.mark.parametrize(('filename', 'mode', 'kwargs'), [
+    ('L.png', 'L', {}),
+    ('LA.png', 'LA', {}),
+    ('RGB.png', 'RGB', {}),
+    ('RGBA.png', 'RGBA', {}),
+    ('P.png', 'P', {}),
+    ('1.png', '1', {}),
+    ('tRNS.png', 'RGB', {'transparency': (0, 0, 0)}),
+])
+def test_vips_like_pil(tmp_path, filename, mode, kwargs):
+    assert_loads_like_pil(save(tmp_path, filename, mode, **kwargs))
+
+
+TIFF_PIXELS = np.random.default_rng(0).integers(0, 256, (8, 10, 3), dtype=np.uint8)
+
+
+@pytest.mark.skipif(image.tifffile is None, reason='tifffile is not installed')
+@pytest.mark.parametrize(('filename', 'data', 'kwargs', 'memmapped'), [
+    ('gray.tif', TIFF_PIXELS[:, :, 0], {}, True),
+    ('rgb.tif', TIFF_PIXELS, {'photometric': 'rgb'}, True),
+    ('planar.tif', TIFF_PIXELS.transpose(2, 0, 1), {'photometric': 'rgb', 'planarconfig': 'separate'}, False),
+    ('pages.tif', TIFF_PIXELS[:, :, :2].transpose(2, 0, 1), {'photometric': 'minisblack'}, False),
+    ('deflate.tif', TIFF_PIXELS, {'photometric': 'rgb', 'compression': 'zlib'}, False),
+])
+def test_tifffile_like_pil(tmp_path, filename, data, kwargs, memmapped):
+    path = str(tmp_path / filename)
+    image.tifffile.imwrite(path, data, **kwargs)
+    assert_loads_like_pil(path)
+    assert isinstance(COCOImage.load_image(path), np.memmap) == memmapped
+
+
+IMAGE_PIXELS = np.random.default_rng(0).integers(0, 256, (8, 10, 3), dtype=np.uint8)
+
+
+@pytest.fixture
+def coco_paths(tmp_path):
+    image_path = str(tmp_path / 'image.png')
+    Image.fromarray(IMAGE_PIXELS).save(image_path)
+
+    annotations_path = str(tmp_path / 'image.json')
+    with open(annotations_path, 'w') as fp:
+        json.dump({'annotations': [
+            {'bbox': [1, 2, 3, 4], 'category_id': 7, 'area': 12, 'iscrowd': 0},
+            {'bbox': [5, 6, 7, 8], 'category_id': 9, 'area': 56, 'iscrowd': 1},
+        ]}, fp)
+
+    return image_path, annotations_path
+
+
+def test_annotations(coco_paths):
+    coco_image = COCOImage(*coco_paths, load_image=False)
+    np.testing.assert_array_equal(coco_image.bboxes, [[1, 2, 3, 4], [5, 6, 7, 8]])
+    np.testing.assert_array_equal(coco_image.category_ids, [7, 9])
+    np.testing.assert_array_equal(coco_image.areas, [12, 56])
+    np.testing.assert_array_equal(coco_image.is_crowds, [0, 1])
+    assert coco_image.image.size == 0
+
+
+def test_image_is_lazy(coco_paths):
+    image_path, annotations_path = coco_paths
+    with mock.patch.object(COCOImage, 'load_image', wraps=COCOImage.load_image) as load_image:
+        coco_image = COCOImage(image_path, annotations_path)
+        load_image.assert_not_called()
+
+        np.testing.assert_array_equal(coco_image.image, IMAGE_PIXELS)
+        np.testing.assert_array_equal(coco_image.image, IMAGE_PIXELS)
+        load_image.assert_called_once_with(image_path)
+
+
+def test_prefetch_image(coco_paths):
+    image_path, annotations_path = coco_paths
+    threads = threading.active_count()
+    with mock.patch.object(COCOImage, 'load_image', wraps=COCOImage.load_image) as load_image:
+        coco_image = COCOImage(image_path, annotations_path, prefetch_image=True)
+        load_image.assert_called_once_with(image_path)
+
+        np.testing.assert_array_equal(coco_image.image, IMAGE_PIXELS)
+        assert load_image.call_count == 1
+
+    assert len(coco_image.annotations) == 2
+    assert threading.active_count() == threads
+
+
+def test_image_setter(coco_paths):
+    coco_image = COCOImage(*coco_paths)
+    coco_image.image = np.zeros(1)
+    np.testing.assert_array_equal(coco_image.image, np.zeros(1))
+
+
+def load_coco_image(image_path, annotations_path):
+    COCOImage(image_path, annotations_path, prefetch_image=True).image
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='fork is not supported')
+def test_prefetch_image_after_fork(coco_paths):
+    COCOImage(*coco_paths, prefetch_image=True)
+
+    process = multiprocessing.get_context('fork').Process(target=load_coco_image, args=coco_paths)
+    process.start()
+    process.join(timeout=30)
+    if process.is_alive():
+        process.kill()
+        process.join()
+    assert process.exitcode == 0
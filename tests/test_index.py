@@ -1,118 +1,169 @@
-from unittest import TestCase
+import copy
+import numpy as np
+import pytest
 from index import COCOIndex
-import pandas as pd
-from itertools import combinations
-
-
-class COCOIndexTestCase(TestCase):
-    def setUp(self):
-        self.index = COCOIndex('', load=False)
-        self.index._index = pd.DataFrame(
-            columns=[
-                'ImageID', 'NumInstances_1', 'NumInstances_2', 'NumInstances_3', 'NumInstances_4', 'NumInstances_5'
-            ],
-            data=[
-                ['Empty', 0, 0, 0, 0, 0],
-                ['Has1', 1, 0, 0, 0, 0],
-                ['Has2', 0, 2, 0, 0, 0],
-                ['Has3', 0, 0, 3, 0, 0],
-                ['Has4', 0, 0, 0, 4, 0],
-                ['Has5', 0, 0, 0, 0, 5],
-                ['Has12', 1, 2, 0, 0, 0],
-                ['Has13', 3, 0, 4, 0, 0],
-                ['Has14', 5, 0, 0, 1, 0],
-                ['Has15', 2, 0, 0, 0, 3],
-                ['Has123', 4, 5, 1, 0, 0],
-                ['Has124', 2, 3, 0, 4, 0],
-                ['Has135', 5, 0, 1, 0, 2],
-                ['Has1235', 3, 4, 5, 0, 1],
-                ['Has1345', 2, 0, 3, 4, 5],
-                ['Has12345', 1, 2, 3, 4, 5],
-            ],
-        )
-
-    def test_get_classes(self):
-        self.assertSetEqual(self.index.get_classes(), {1, 2, 3, 4, 5})
-
-    def test_get_images(self):
-        self.assertSetEqual(self.index.get_images(), {
-            'Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has13', 'Has14', 'Has15', 'Has123', 'Has124',
-            'Has135', 'Has1235', 'Has1345', 'Has12345',
-        })
-
-    def test_get_images_with_classes(self):
-        # all classes
-        self.assertSetEqual(self.index.get_images_with_classes(list(self.index.get_classes())),
-                            self.index.get_images() - {'Empty'})
-
-        # all combinations of classes
-        for i in range(1, 6):
-            for class_ids in combinations(self.index.get_classes(), i):
-                self.assertSetEqual(
-                    self.index.get_images_with_classes(list(class_ids)),
-                    {iid for iid in self.index.get_images() if any(str(cid) in iid for cid in class_ids)}
-                )
-
-    def test_get_bounded_num_instances_lower(self):
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], lower=1), {
-            'Has1', 'Has12', 'Has13', 'Has14', 'Has15', 'Has123', 'Has124', 'Has135', 'Has1235', 'Has1345', 'Has12345'
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], lower=2), {
-            'Has13', 'Has14', 'Has15', 'Has123', 'Has124', 'Has135', 'Has1235', 'Has1345'
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], lower=3), {
-            'Has13', 'Has14', 'Has123', 'Has135', 'Has1235'
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], lower=4), {
-            'Has14', 'Has123', 'Has135'
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], lower=5), {
-            'Has14', 'Has135'
-        })
-
-        self.assertEqual(len(self.index.get_images_with_bounded_num_instances([1], lower=6)), 0)
-
-    def test_get_bounded_num_instances_upper(self):
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], upper=6), {
-            'Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has13', 'Has14', 'Has15', 'Has123', 'Has124',
-            'Has135', 'Has1235', 'Has1345', 'Has12345',
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], upper=5), {
-            'Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has13', 'Has15', 'Has123', 'Has124', 'Has1235',
-            'Has1345', 'Has12345',
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], upper=4), {
-            'Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has13', 'Has15', 'Has124', 'Has1235', 'Has1345',
-            'Has12345',
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], upper=3), {
-            'Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has15', 'Has124', 'Has1345', 'Has12345',
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], upper=2), {
-            'Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has12345',
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], upper=1), {
-            'Empty', 'Has2', 'Has3', 'Has4', 'Has5',
-        })
-
-    def test_get_bounded_num_instances_lower_upper(self):
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], lower=2, upper=3), {
-            'Has15', 'Has124', 'Has1345',
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], lower=1, upper=3), {
-            'Has1', 'Has12', 'Has15', 'Has124', 'Has1345', 'Has12345'
-        })
-
-        self.assertSetEqual(self.index.get_images_with_bounded_num_instances([1], lower=2, upper=4), {
-            'Has13', 'Has15', 'Has124', 'Has1235', 'Has1345',
-        })
+
+
+# ImageID, NumInstances_1, NumInstances_2, NumInstances_3, NumInstances_4, NumInstances_5
+FIXTURE_ROWS = [
+    ('Empty', 0, 0, 0, 0, 0),
+    ('Has1', 1, 0, 0, 0, 0),
+    ('Has2', 0, 2, 0, 0, 0),
+    ('Has3', 0, 0, 3, 0, 0),
+    ('Has4', 0, 0, 0, 4, 0),
+    ('Has5', 0, 0, 0, 0, 5),
+    ('Has12', 1, 2, 0, 0, 0),
+    ('Has13', 3, 0, 4, 0, 0),
+    ('Has14', 5, 0, 0, 1, 0),
+    ('Has15', 2, 0, 0, 0, 3),
+    ('Has123', 4, 5, 1, 0, 0),
+    ('Has124', 2, 3, 0, 4, 0),
+    ('Has135', 5, 0, 1, 0, 2),
+    ('Has1235', 3, 4, 5, 0, 1),
+    ('Has1345', 2, 0, 3, 4, 5),
+    ('Has12345', 1, 2, 3, 4, 5),
+]
+
+
+def image_ids(*ids: str) -> np.ndarray:
+    return np.array(sorted(ids), dtype='U8')
+
+
+IMAGE_IDS = image_ids(*(row[0] for row in FIXTURE_ROWS))
+
+# the classes each image has are the digits of its id, found in a single scan of the id
+IMAGE_CLASSES = {iid: {int(c) for c in iid if c.isdigit()} for iid in IMAGE_IDS}
+
+# PRESENCE[i, class id - 1] is whether image i has the class
+PRESENCE = np.zeros((len(IMAGE_IDS), 5), dtype=bool)
+for i, iid in enumerate(IMAGE_IDS):
+    PRESENCE[i, [class_id - 1 for class_id in IMAGE_CLASSES[iid]]] = True
+
+# the images with any of the classes of every combination of classes, bit b of a mask is class b + 1
+EXPECTED_CLASSES = {}
+for mask in range(1, 1 << 5):
+    class_ids = frozenset(b + 1 for b in range(5) if mask & (1 << b))
+    EXPECTED_CLASSES[class_ids] = IMAGE_IDS[PRESENCE[:, [class_id - 1 for class_id in class_ids]].any(axis=1)]
+
+
+def assert_array_equal_as_set(actual, expected_sorted: np.ndarray):
+    np.testing.assert_array_equal(np.sort(np.array(list(actual), dtype=str)), expected_sorted)
+
+
+@pytest.fixture(scope='session')
+def fixture_index() -> COCOIndex:
+    image_id_column, *num_instances = zip(*FIXTURE_ROWS)
+    return COCOIndex._from_columns({
+        'ImageID': np.array(image_id_column),
+        **{f'NumInstances_{i}': np.array(n, dtype=np.uint8) for i, n in enumerate(num_instances, start=1)},
+    })
+
+
+@pytest.fixture
+def index(fixture_index: COCOIndex) -> COCOIndex:
+    # keep and remove replace the DataFrame instead of mutating it, so every test can share the fixture's
+    return copy.copy(fixture_index)
+
+
+def test_get_classes(index):
+    assert index.get_classes() == {1, 2, 3, 4, 5}
+
+
+def test_get_images(index):
+    assert_array_equal_as_set(index.get_images(), IMAGE_IDS)
+
+
+def test_get_images_with_classes(index):
+    # all classes
+    assert index.get_images_with_classes(list(index.get_classes())) == index.get_images() - {'Empty'}
+
+    # all combinations of classes
+    for class_ids, expected in EXPECTED_CLASSES.items():
+        assert_array_equal_as_set(index.get_images_with_classes(list(class_ids)), expected)
+
+
+@pytest.mark.parametrize(('lower', 'upper', 'expected'), [
+    (1, None, image_ids(
+        'Has1', 'Has12', 'Has13', 'Has14', 'Has15', 'Has123', 'Has124', 'Has135', 'Has1235', 'Has1345', 'Has12345',
+    )),
+    (2, None, image_ids('Has13', 'Has14', 'Has15', 'Has123', 'Has124', 'Has135', 'Has1235', 'Has1345')),
+    (3, None, image_ids('Has13', 'Has14', 'Has123', 'Has135', 'Has1235')),
+    (4, None, image_ids('Has14', 'Has123', 'Has135')),
+    (5, None, image_ids('Has14', 'Has135')),
+    (6, None, image_ids()),
+    (None, 6, IMAGE_IDS),
+    (None, 5, image_ids(
+        'Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has13', 'Has15', 'Has123', 'Has124', 'Has1235',
+        'Has1345', 'Has12345',
+    )),
+    (None, 4, image_ids(
+        'Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has13', 'Has15', 'Has124', 'Has1235', 'Has1345',
+        'Has12345',
+    )),
+    (None, 3, image_ids(
+        'Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has15', 'Has124', 'Has1345', 'Has12345',
+    )),
+    (None, 2, image_ids('Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has12345')),
+    (None, 1, image_ids('Empty', 'Has2', 'Has3', 'Has4', 'Has5')),
+    (2, 3, image_ids('Has15', 'Has124', 'Has1345')),
+    (1, 3, image_ids('Has1', 'Has12', 'Has15', 'Has124', 'Has1345', 'Has12345')),
+    (2, 4, image_ids('Has13', 'Has15', 'Has124', 'Has1235', 'Has1345')),
+])
+def test_get_bounded_num_instances(index, lower, upper, expected):
+    assert_array_equal_as_set(index.get_images_with_bounded_num_instances([1], lower=lower, upper=upper), expected)
+
+
+# every class has to be within the bounds, not just one of them, e.g. Has13 isn't returned for lower=1 of classes
+# 1 and 2 because it has no instances of class 2, or for upper=4 of classes 1 and 3 because it has 4 of class 3
+@pytest.mark.parametrize(('classes', 'lower', 'upper', 'expected'), [
+    ([1, 2], 1, None, image_ids('Has12', 'Has123', 'Has124', 'Has1235', 'Has12345')),
+    ([1, 3], None, 4, image_ids(
+        'Empty', 'Has1', 'Has2', 'Has3', 'Has4', 'Has5', 'Has12', 'Has15', 'Has124', 'Has1345', 'Has12345',
+    )),
+    ([1, 3], 2, 5, image_ids('Has13', 'Has1345')),
+    ([], 1, None, IMAGE_IDS),
+    ([], None, None, IMAGE_IDS),
+])
+def test_get_bounded_num_instances_classes(index, classes, lower, upper, expected):
+    assert_array_equal_as_set(index.get_images_with_bounded_num_instances(classes, lower=lower, upper=upper), expected)
+
+
+@pytest.mark.parametrize('filename', ['index.csv', 'index.parquet'])
+def test_load(index, tmp_path, filename):
+    df = index._index.assign(TotalArea=1.0, CategoryOf_Highest_NumInstances=1)
+    path = tmp_path / filename
+    if filename.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+    loaded = COCOIndex(str(path))
+    assert list(loaded._index.columns) == list(index._index.columns)
+    assert list(loaded.load().columns) == list(df.columns)
+    assert loaded.get_images() == index.get_images()
+    assert loaded.get_images_with_classes([1]) == index.get_images_with_classes([1])
+
+    loaded.remove({'Has1', 'Has2', 'Missing'})
+    assert loaded.get_images() == index.get_images() - {'Has1', 'Has2'}
+    loaded.keep({'Has2', 'Has3', 'Has4'})
+    assert loaded.get_images() == {'Has3', 'Has4'}
+
+
+def test_get_bounded_num_instances_nan():
+    index = COCOIndex._from_columns({'ImageID': np.array(['Zero', 'Missing']), 'NumInstances_1': np.array([0, np.nan])})
+    assert index.get_images_with_bounded_num_instances([1], upper=1) == {'Zero'}
+    assert index.get_images_with_bounded_num_instances([1], lower=0) == {'Zero'}
+
+
+def test_missing_image_ids(tmp_path):
+    path = tmp_path / 'index.csv'
+    path.write_text('ImageID,NumInstances_1\nNA,1\nx,1\nnan,0\n')
+    index = COCOIndex(str(path))
+    assert index.get_images() == {'NA', 'x', 'nan'}
+    assert index.get_images_with_classes([1]) == {'NA', 'x'}
+
+    # a missing ImageID isn't returned as the last category
+    index = COCOIndex._from_columns({'ImageID': np.array(['x', None]), 'NumInstances_1': np.array([1, 1])})
+    assert index.get_images() == {'x'}
+    assert index.get_images_with_classes([1]) == {'x'}
+    assert index.get_images_with_bounded_num_instances([1], lower=1) == {'x'}
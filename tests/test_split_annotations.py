@@ -0,0 +1,38 @@
+import os
+from unittest import mock
+import lmdb
+import split_annotations
+from split_annotations import split_lmdb, split_sequentially
+
+ANNOTATIONS_BY_FILENAME = {
+    f'image{i}.png': [
+        {'id': j, 'category_id': j % 3, 'iscrowd': 0, 'area': 1.5 * j, 'bbox': [j, j, 2, 2],
+         'segmentation': [[j, j, j + 2, j, j + 2, j + 2]]}
+        for j in range(i % 4)
+    ]
+    for i in range(10)
+}
+
+
+def test_split_lmdb(tmp_path):
+    files_dir = tmp_path / 'files'
+    lmdb_dir = tmp_path / 'lmdb'
+    files_dir.mkdir()
+    split_sequentially(str(files_dir), ANNOTATIONS_BY_FILENAME)
+
+    # 10 images in batches of 3 writes 3 full batches and a partial batch of 1
+    with mock.patch('split_annotations.LMDB_BATCH_SIZE', 3), \
+            mock.patch('split_annotations.write_lmdb_batch', wraps=split_annotations.write_lmdb_batch) as write_batch:
+        split_lmdb(str(lmdb_dir), ANNOTATIONS_BY_FILENAME)
+    assert [len(call.args[1]) for call in write_batch.call_args_list] == [3, 3, 3, 1]
+
+    env = lmdb.open(str(lmdb_dir), readonly=True, lock=False)
+    try:
+        assert env.stat()['entries'] == len(ANNOTATIONS_BY_FILENAME)
+        with env.begin() as txn:
+            for filename in ANNOTATIONS_BY_FILENAME:
+                key = os.path.splitext(filename)[0]
+                with open(files_dir / f'{key}.json', 'rb') as fp:
+                    assert txn.get(key.encode()) == fp.read()
+    finally:
+        env.close()